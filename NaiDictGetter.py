@@ -1,5 +1,7 @@
 from PIL import Image
+from enum import IntEnum
 import json
+import sys
 
 from stealth_pnginfo import read_info_from_image_stealth
 
@@ -22,24 +24,109 @@ WEBUI_OPTION_MAPPING = {
     "denoising_strength": "denoising_strength"
 }
 
-def _get_infostr_from_img(img):
-    exif = None
-    pnginfo = None
+# NaiResult에 슬롯으로 저장되는 옵션 키 (WebUI 키는 매핑된 이름으로 저장)
+# 값은 원본 타입 그대로 저장하여 to_legacy() 결과가 기존과 같도록 함
+NAIRESULT_OPTION_KEYS = ("steps", "height", "width", "scale", "seed", "sampler",
+                         "n_samples", "sm", "sm_dyn", "clip_skip", "schedule_type",
+                         "size", "model", "model_hash", "denoising_strength")
+
+
+class NaiStatus(IntEnum):
+    """get_naidict_from_img가 반환하던 error_code와 같은 값"""
+    NO_INFO = 0         # EXIF, stealth pnginfo 모두 없음
+    UNKNOWN_INFO = 1    # 정보는 있으나 dict로 변환할 수 없음
+    PARSE_FAILED = 2    # dict로 변환했으나 nai_dict를 만들 수 없음
+    OK = 3
+
+
+class NaiResult:
+    """
+    get_naidict_from_img 결과를 담는 가벼운 객체.
+    옵션은 슬롯으로, etc는 (키, 값) 튜플로 보관하고
+    접근할 때 dict로 만든다. to_legacy()로 기존 (dict, error_code) 형태를 얻는다.
+    """
+    __slots__ = ("status", "raw", "prompt", "negative_prompt",
+                 "_option_alias", "_etc_items") + NAIRESULT_OPTION_KEYS
+
+    def __init__(self, status, raw=None):
+        self.status = status
+        self.raw = raw
+        self.prompt = None
+        self.negative_prompt = None
+        self._option_alias = None
+        self._etc_items = ()
+        for key in NAIRESULT_OPTION_KEYS:
+            setattr(self, key, None)
+
+    @classmethod
+    def from_naidict(cls, nai_dict):
+        result = cls(NaiStatus.OK)
+        result.prompt = nai_dict["prompt"]
+        result.negative_prompt = nai_dict["negative_prompt"]
+        alias = {}
+        for key, value in nai_dict["option"].items():
+            if key in NAIRESULT_OPTION_KEYS:
+                setattr(result, key, value)
+            else:
+                alias[sys.intern(key)] = value
+        result._option_alias = alias or None
+        result._etc_items = tuple((sys.intern(key), value)
+                                  for key, value in nai_dict["etc"].items())
+        return result
+
+    def __repr__(self):
+        if self.status == NaiStatus.OK:
+            return "NaiResult(%s, prompt=%r)" % (self.status.name, self.prompt)
+        return "NaiResult(%s, raw=%r)" % (self.status.name, self.raw)
+
+    @property
+    def option(self):
+        option_dict = {}
+        for key in NAIRESULT_OPTION_KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                option_dict[key] = value
+        if self._option_alias:
+            option_dict.update(self._option_alias)
+        return option_dict
+
+    @property
+    def etc(self):
+        return dict(self._etc_items)
+
+    def to_naidict(self):
+        if self.status != NaiStatus.OK:
+            return None
+        return {
+            "prompt": self.prompt,
+            "negative_prompt": self.negative_prompt,
+            "option": self.option,
+            "etc": self.etc
+        }
+
+    def to_legacy(self):
+        """기존 get_naidict_from_img의 (dict 또는 원본 문자열 또는 None, error_code) 반환값"""
+        if self.status == NaiStatus.OK:
+            return self.to_naidict(), int(self.status)
+        return self.raw, int(self.status)
+
 
-    # exif
-    if img.info:
+def get_exif_from_info(info):
+    exif = None
+    if info:
         try:
-            exif = json.dumps(img.info)
+            exif = json.dumps(info)
         except Exception as e:
             print(e)
+    return exif
 
-    # stealth pnginfo
+def get_pnginfo_from_img(img):
+    pnginfo = None
     try:
         pnginfo = read_info_from_image_stealth(img)
     except Exception as e:
         print(e)
-
-    return exif, pnginfo
+    return pnginfo
 
 def is_nai_exif(info_str):
     """nai 이미지면 exif의 원본 JSON에 'Comment' 키가 존재하고 None이 아닌 경우 True를 반환"""
@@ -180,46 +267,64 @@ def _get_naidict_from_exifdict(exif_dict):
     return None
 
 def get_naidict_from_file(src):
+    return get_result_from_file(src).to_legacy()
+
+def get_naidict_from_img(img):
+    return get_result_from_img(img).to_legacy()
+
+def get_result_from_file(src):
     try:
         img = Image.open(src)
         img.load()
     except Exception as e:
         print(e)
-        return None, 0
-    return get_naidict_from_img(img)
+        return NaiResult(NaiStatus.NO_INFO)
+    return get_result_from_img(img)
 
-def get_naidict_from_img(img):
-    exif, pnginfo = _get_infostr_from_img(img)
-    if not exif and not pnginfo:
-        return None, 0
+def get_result_from_img(img):
+    exif = get_exif_from_info(img.info)
+    return get_result_from_infostr(exif, lambda: get_pnginfo_from_img(img))
+
+def _get_naidict_from_nai_infostr(info_str):
+    if is_nai_exif(info_str):
+        try:
+            data = json.loads(info_str)
+            nai_exif = json.loads(data['Comment'])
+            return _get_naidict_from_exifdict(nai_exif)
+        except Exception as e:
+            print("Error in nai old method extraction:", e)
+    return None
 
+def get_result_from_infostr(exif, read_pnginfo):
+    """
+    exif 문자열과 stealth pnginfo를 읽는 함수로부터 NaiResult를 만듭니다.
+    exif가 nai 이미지라면 결과가 정해지므로 read_pnginfo는 호출하지 않습니다.
+    """
     # 먼저 nai 이미지 여부를 검사하여, nai 이미지면 old 방식으로 처리
-    for info_str in [exif, pnginfo]:
-        if is_nai_exif(info_str):
-            try:
-                data = json.loads(info_str)
-                nai_exif = json.loads(data['Comment'])
-                nd = _get_naidict_from_exifdict(nai_exif)
-                if nd:
-                    return nd, 3
-            except Exception as e:
-                print("Error in nai old method extraction:", e)
+    nd = _get_naidict_from_nai_infostr(exif)
+    if nd:
+        return NaiResult.from_naidict(nd)
+
+    pnginfo = read_pnginfo()
+    if not exif and not pnginfo:
+        return NaiResult(NaiStatus.NO_INFO)
+
+    nd = _get_naidict_from_nai_infostr(pnginfo)
+    if nd:
+        return NaiResult.from_naidict(nd)
 
     # nai 이미지가 아니라면 WebUI 방식(new)으로 처리
     ed1 = _get_exifdict_from_infostr(exif)
     ed2 = _get_exifdict_from_infostr(pnginfo)
     if not ed1 and not ed2:
-        return exif or pnginfo, 1
+        return NaiResult(NaiStatus.UNKNOWN_INFO, exif or pnginfo)
 
     nd1 = _get_naidict_from_exifdict(ed1) if ed1 else None
     nd2 = _get_naidict_from_exifdict(ed2) if ed2 else None
     if not nd1 and not nd2:
-        return exif or pnginfo, 2
+        return NaiResult(NaiStatus.PARSE_FAILED, exif or pnginfo)
 
-    if nd1:
-        return nd1, 3
-    else:
-        return nd2, 3
+    return NaiResult.from_naidict(nd1 or nd2)
 
 if __name__ == "__main__":
     src = "target.webp"
@@ -0,0 +1,386 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+from PIL import Image, PngImagePlugin
+
+import NaiDictGetter
+from stealth_pnginfo import image_lsb, lsb_from_bytes, read_info_from_lsb, write_info_to_image_stealth
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PIL의 ImageFile.SAFEBLOCK과 같은 텍스트 청크 압축 해제 한도
+MAX_TEXT_CHUNK = 1024 * 1024
+
+# PIL이 img.info에 텍스트가 아닌 값을 넣는 청크.
+# 이런 청크가 있으면 결과가 같도록 Image.open 방식으로 처리함
+PIL_INFO_CHUNKS = {b"iCCP", b"tRNS", b"gAMA", b"cHRM", b"sRGB",
+                   b"pHYs", b"eXIf", b"acTL"}
+
+
+class FallbackError(Exception):
+    """mmap으로 직접 읽을 수 없어 Image.open 방식으로 처리해야 하는 파일"""
+
+
+def _zlib_decompress(data):
+    dobj = zlib.decompressobj()
+    plaintext = dobj.decompress(data, MAX_TEXT_CHUNK)
+    if dobj.unconsumed_tail:
+        raise FallbackError("Decompressed text chunk is too large")
+    return plaintext
+
+
+def _split_nul(buf, mv, start, end):
+    """buf[start:end]를 첫 NUL 바이트 기준으로 나눈 memoryview 두 개 (복사 없음)"""
+    index = buf.find(b"\0", start, end)
+    if index == -1:
+        raise ValueError
+    return mv[start:index], index + 1
+
+
+def _read_text_chunk(info, cid, buf, mv, start, end):
+    """PIL의 PngStream.chunk_tEXt/zTXt/iTXt와 같은 방식으로 info를 채움"""
+    if cid == b"tEXt":
+        try:
+            k, v_start = _split_nul(buf, mv, start, end)
+        except ValueError:
+            k, v_start = mv[start:end], end
+        if k:
+            k = str(k, "latin-1")
+            v = mv[v_start:end]
+            info[k] = bytes(v) if k == "exif" else str(v, "latin-1", "replace")
+    elif cid == b"zTXt":
+        try:
+            k, v_start = _split_nul(buf, mv, start, end)
+        except ValueError:
+            k, v_start = mv[start:end], end
+        comp_method = buf[v_start] if v_start < end else 0
+        if comp_method != 0:
+            raise FallbackError("Unknown compression method in zTXt chunk")
+        try:
+            v = _zlib_decompress(mv[v_start + 1:end])
+        except zlib.error:
+            v = b""
+        if k:
+            info[str(k, "latin-1")] = v.decode("latin-1", "replace")
+    elif cid == b"iTXt":
+        try:
+            k, r_start = _split_nul(buf, mv, start, end)
+        except ValueError:
+            return
+        if end - r_start < 2:
+            return
+        cf, cm = buf[r_start], buf[r_start + 1]
+        try:
+            lang, tk_start = _split_nul(buf, mv, r_start + 2, end)
+            tk, v_start = _split_nul(buf, mv, tk_start, end)
+        except ValueError:
+            return
+        v = mv[v_start:end]
+        if cf != 0:
+            if cm != 0:
+                return
+            try:
+                v = _zlib_decompress(v)
+            except zlib.error:
+                return
+        if k == b"XML:com.adobe.xmp":
+            info["xmp"] = bytes(v)
+        try:
+            k = str(k, "latin-1")
+            str(lang, "utf-8")
+            str(tk, "utf-8")
+            v = str(v, "utf-8")
+        except UnicodeError:
+            return
+        info[k] = v
+
+
+def read_png_info(buf):
+    """
+    PNG 버퍼(mmap)의 청크 경계를 직접 따라가며 텍스트 청크와 IHDR의 인터레이스 여부로
+    info dict를 만듭니다. PIL이 img.info에 넣는 다른 값이 생기는 청크(PIL_INFO_CHUNKS)가
+    있으면 FallbackError를 발생시키므로, 반환된 info는 그런 청크가 없는 파일에서만
+    img.info와 같습니다.
+    IDAT 등 나머지 청크는 길이만 보고 건너뛰며, 청크 데이터는 memoryview slice로
+    crc32/zlib에 복사 없이 전달합니다.
+    (info, IHDR 값 튜플, IDAT 데이터의 (start, end) 목록)을 반환합니다.
+    """
+    info = {}
+    header = None
+    idat = []
+    size = len(buf)
+    if size < 8 or buf[:8] != PNG_SIGNATURE:
+        raise FallbackError("Not a PNG file")
+
+    with memoryview(buf) as mv:
+        pos = 8
+        seen_idat = False
+        while True:
+            if pos + 8 > size:
+                raise FallbackError("Truncated PNG chunk")
+            length, cid = struct.unpack_from(">I4s", buf, pos)
+            start = pos + 8
+            end = start + length
+            if end + 4 > size:
+                raise FallbackError("Truncated PNG chunk")
+            if cid == b"IEND":
+                break
+            if cid in PIL_INFO_CHUNKS:
+                raise FallbackError("Chunk %r is stored in img.info by PIL" % cid)
+            if cid == b"IHDR" and length >= 13:
+                # width, height, bit depth, color type, compression, filter, interlace
+                header = struct.unpack_from(">IIBBBBB", buf, start)
+                if header[5] != 0:
+                    raise FallbackError("Unknown PNG filter category")
+                # PIL의 PngStream.chunk_IHDR처럼 인터레이스 여부를 info에 기록
+                if header[6]:
+                    info["interlace"] = 1
+            elif cid == b"IDAT":
+                seen_idat = True
+                idat.append((start, end))
+            elif cid in (b"tEXt", b"zTXt", b"iTXt"):
+                # PIL은 IDAT 이전 청크의 CRC를 검사함
+                if not seen_idat:
+                    crc = struct.unpack_from(">I", buf, end)[0]
+                    if zlib.crc32(mv[pos + 4:end]) != crc:
+                        raise FallbackError("Broken PNG chunk crc")
+                try:
+                    _read_text_chunk(info, cid, buf, mv, start, end)
+                except UnicodeDecodeError:
+                    if not seen_idat:
+                        raise FallbackError("Broken text chunk")
+                    break
+            pos = end + 4
+    if header is None:
+        raise FallbackError("Missing IHDR chunk")
+    return info, header, idat
+
+
+class FirstColumnReader:
+    """
+    IDAT을 앞에서부터 필요한 행까지만 압축 해제하고, 첫 번째 열 픽셀만 필터를 복원합니다.
+    PNG 필터는 왼쪽/위/왼쪽 위 픽셀만 참조하므로 첫 열은 다른 열 없이 복원할 수 있습니다.
+    8비트 RGB/RGBA, 인터레이스 없는 이미지만 지원합니다.
+    """
+
+    def __init__(self, buf, header, idat):
+        width, height, bit_depth, color_type, _, _, interlace = header
+        if bit_depth != 8 or interlace != 0 or color_type not in (2, 6):
+            raise FallbackError("Unsupported PNG pixel format")
+        self.bpp = 4 if color_type == 6 else 3
+        self.stride = 1 + width * self.bpp
+        self.buf = buf
+        self.idat = iter(idat)
+        self.dobj = zlib.decompressobj()
+        self.pending = bytearray()
+        self.column = bytearray()
+
+    def _inflate(self, size):
+        # 복사 없이 IDAT memoryview를 넘기고, size 바이트가 모이면 멈춤
+        while len(self.pending) < size:
+            if self.dobj.unconsumed_tail:
+                data = self.dobj.unconsumed_tail
+            else:
+                span = next(self.idat, None)
+                if span is None:
+                    raise FallbackError("Truncated IDAT stream")
+                data = memoryview(self.buf)[span[0]:span[1]]
+            self.pending += self.dobj.decompress(data, size - len(self.pending))
+
+    def read(self, rows):
+        """처음 rows개 행의 첫 번째 열 픽셀 바이트"""
+        bpp = self.bpp
+        done = len(self.column) // bpp
+        if rows > done:
+            self._inflate((rows - done) * self.stride)
+            prev = self.column[-bpp:] if done else bytes(bpp)
+            for row in range(rows - done):
+                offset = row * self.stride
+                filter_type = self.pending[offset]
+                raw = self.pending[offset + 1:offset + 1 + bpp]
+                # 첫 열은 왼쪽(a)과 왼쪽 위(c)가 0이므로 Sub는 None, Avg/Paeth는 Up과 같음
+                if filter_type in (0, 1):
+                    pixel = raw
+                elif filter_type == 2 or filter_type == 4:
+                    pixel = bytes((x + b) & 0xFF for x, b in zip(raw, prev))
+                elif filter_type == 3:
+                    pixel = bytes((x + (b >> 1)) & 0xFF for x, b in zip(raw, prev))
+                else:
+                    raise FallbackError("Unknown PNG filter type")
+                self.column += pixel
+                prev = pixel
+            del self.pending[:(rows - done) * self.stride]
+        return bytes(self.column[:rows * bpp])
+
+
+def read_stealth_from_png(buf, header, idat):
+    """
+    stealth pnginfo를 읽습니다. 서명 확인처럼 첫 열 안에서 끝나는 읽기는
+    필요한 행만 압축 해제하고, 그보다 많은 픽셀이 필요할 때만 mmap 위에서
+    Image.open으로 전체 이미지를 디코딩합니다.
+    """
+    width, height = header[0], header[1]
+    has_alpha = header[3] == 6
+    try:
+        column = FirstColumnReader(buf, header, idat)
+    except FallbackError:
+        column = None
+    full_image = []
+
+    def get_lsb(count):
+        if column is not None and count <= height:
+            return lsb_from_bytes(column.read(count), has_alpha)
+        if not full_image:
+            img = Image.open(buf)
+            img.load()
+            full_image.append(img)
+        return image_lsb(full_image[0], count)
+
+    if column is None:
+        # 지원하지 않는 픽셀 형식은 PIL 모드 그대로 기존 방식으로 처리
+        img = Image.open(buf)
+        img.load()
+        return NaiDictGetter.get_pnginfo_from_img(img)
+    return read_info_from_lsb(width, height, has_alpha, get_lsb)
+
+
+def get_result_from_file(src):
+    """
+    NaiDictGetter.get_result_from_file과 같은 결과를 mmap으로 읽어서 만듭니다.
+    텍스트 청크로 결과가 정해지면 픽셀은 디코딩하지 않고, stealth pnginfo가 필요하면
+    read_stealth_from_png로 필요한 만큼만 디코딩합니다.
+    기존 방식과 달리 IDAT 전체를 검증하지 않으므로, 뒷부분 픽셀 데이터가 깨진
+    파일도 결과를 반환할 수 있습니다.
+    """
+    try:
+        with open(src, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return NaiDictGetter.get_result_from_file(src)
+
+    try:
+        try:
+            info, header, idat = read_png_info(buf)
+        except FallbackError:
+            return NaiDictGetter.get_result_from_file(src)
+
+        def read_pnginfo():
+            try:
+                return read_stealth_from_png(buf, header, idat)
+            except Exception as e:
+                print(e)
+                return None
+
+        exif = NaiDictGetter.get_exif_from_info(info)
+        return NaiDictGetter.get_result_from_infostr(exif, read_pnginfo)
+    finally:
+        buf.close()
+
+
+def scan_files(file_list):
+    """파일 목록을 순서대로 읽어 (파일 경로, NaiResult)를 반환합니다."""
+    for src in file_list:
+        yield src, get_result_from_file(src)
+
+
+def _list_images(target_dir):
+    file_list = []
+    for root, _, files in os.walk(target_dir):
+        for name in files:
+            if name.lower().endswith((".png", ".webp")):
+                file_list.append(os.path.join(root, name))
+    file_list.sort()
+    return file_list
+
+
+def _drop_caches():
+    # 리눅스에서 root 권한이 있을 때만 페이지 캐시를 비울 수 있음
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def benchmark(target_dir, repeat=3, cold=False):
+    """
+    Image.open + img.load() 방식과 mmap 방식의 처리 속도를 비교합니다.
+    cold=True면 매 회차마다 페이지 캐시를 비우고 측정합니다.
+    """
+    file_list = _list_images(target_dir)
+    if not file_list:
+        print("No image in", target_dir)
+        return None
+
+    readers = [("Image.open", NaiDictGetter.get_result_from_file),
+               ("mmap", get_result_from_file)]
+    best = {}
+    for _ in range(repeat):
+        for name, reader in readers:
+            if cold and not _drop_caches():
+                print("Cannot drop page cache (need root on linux), measuring warm cache")
+                cold = False
+            start = time.perf_counter()
+            for src in file_list:
+                reader(src)
+            elapsed = time.perf_counter() - start
+            best[name] = min(best.get(name, elapsed), elapsed)
+
+    print("%s: %d files, %s cache" % (target_dir, len(file_list), "cold" if cold else "warm"))
+    for name, _ in readers:
+        print("%-10s %8.3fs  %8.1f files/s" % (name, best[name], len(file_list) / best[name]))
+    print("speedup    %8.2fx" % (best["Image.open"] / best["mmap"]))
+    return best
+
+
+def make_synthetic_corpus(target_dir, kind, count=20, size=(832, 1216)):
+    """
+    벤치마크용 이미지를 만듭니다. 픽셀은 압축되지 않는 노이즈입니다.
+    kind: "nai" (Comment 텍스트 청크 + alpha stealth), "webui" (RGB, parameters 텍스트 청크),
+          "stealth" (텍스트 청크 없이 alpha stealth만)
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    mode = "RGB" if kind == "webui" else "RGBA"
+    for i in range(count):
+        img = Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+        comment = json.dumps({"prompt": "1girl, {smile}, " * 40, "uc": "lowres",
+                              "steps": 28, "scale": 5, "seed": i, "sampler": "k_euler"})
+        pnginfo = PngImagePlugin.PngInfo()
+        if kind == "nai":
+            pnginfo.add_text("Software", "NovelAI")
+            pnginfo.add_text("Comment", comment)
+        elif kind == "webui":
+            pnginfo.add_text("parameters", "1girl, smile\nNegative prompt: lowres\n"
+                                           "Steps: 28, Sampler: Euler a, CFG scale: 7, Seed: %d" % i)
+        if kind in ("nai", "stealth"):
+            write_info_to_image_stealth(img, json.dumps({"Comment": comment}), "alpha", True)
+        img.save(os.path.join(target_dir, "%s_%03d.png" % (kind, i)), pnginfo=pnginfo,
+                 compress_level=1)
+
+
+def benchmark_synthetic(repeat=3, cold=False):
+    """nai, webui, stealth 세 종류의 이미지 각각에 대해 benchmark를 실행합니다."""
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        for kind in ("nai", "webui", "stealth"):
+            target_dir = os.path.join(root, kind)
+            make_synthetic_corpus(target_dir, kind)
+            results[kind] = benchmark(target_dir, repeat, cold)
+    return results
+
+
+if __name__ == "__main__":
+    cold = "--cold" in sys.argv
+    if "--synthetic" in sys.argv:
+        benchmark_synthetic(cold=cold)
+    else:
+        args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+        benchmark(args[0] if args else ".", cold=cold)
@@ -0,0 +1,491 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+import NaiDictGetter
+import conformance_reference as reference
+import prompt_converter
+from stealth_pnginfo import write_info_to_image_stealth
+
+# 최적화 구현의 성능 한도. max_seconds는 최적화 구현의 전체 실행 시간,
+# min_speedup은 (기준 구현 시간 / 최적화 구현 시간)의 최솟값.
+# min_speedup은 실제로 최적화한 경로에만 두고, 기존 코드와 같은 함수는 max_seconds만 검사
+PERF_BUDGET = {
+    "calculate_w_values": {"max_seconds": 5.0},
+    "incremental_convert": {"max_seconds": 10.0, "min_speedup": 2.0},
+    "parse_webui_exif": {"max_seconds": 1.0},
+    "naidict_from_exifdict": {"max_seconds": 1.0},
+    "naidict_from_infostr": {"max_seconds": 1.0},
+    "stealth": {"max_seconds": 30.0, "min_speedup": 1.5},
+    "naidict_from_file": {"max_seconds": 30.0, "min_speedup": 1.5},
+    "bulk_mixed": {"max_seconds": 30.0, "min_speedup": 1.5},
+    "bulk_text_chunk": {"max_seconds": 10.0, "min_speedup": 5.0},
+    "bulk_stealth": {"max_seconds": 30.0, "min_speedup": 1.5},
+}
+
+WORD_LIST = ["1girl", "solo", "long_hair", "smile", "blue eyes", "masterpiece",
+             "best quality", "hat", "looking_at_viewer", "outdoors", "한글 태그",
+             "artist:abc", "x", "very_long_tag_name_with_underscores"]
+
+
+# ---------------------------------------------------------------------------
+# 입력 생성
+
+def random_prompt(rng, max_tags=40):
+    """중첩된 {} / [] 와 빈 토큰, 짝이 맞지 않는 괄호가 섞인 랜덤 프롬프트"""
+    def group(depth):
+        parts = []
+        for _ in range(rng.randint(1, 4)):
+            if depth < 4 and rng.random() < 0.3:
+                parts.append(group(depth + 1))
+            else:
+                parts.append(rng.choice(WORD_LIST))
+        inner = ", ".join(parts)
+        open_ch, close_ch = rng.choice(["{}", "[]", "{}", "[]", "  "])
+        return open_ch * rng.randint(1, 3) + inner + close_ch * rng.randint(0, 3)
+
+    tokens = []
+    for _ in range(rng.randint(0, max_tags)):
+        r = rng.random()
+        if r < 0.3:
+            tokens.append(group(0))
+        elif r < 0.35:
+            tokens.append(rng.choice(["", " ", "{", "]", "}}", "[["]))
+        else:
+            tokens.append(rng.choice(WORD_LIST))
+    sep = rng.choice([", ", ",", " , "])
+    text = sep.join(tokens)
+    if rng.random() < 0.1:
+        text = "{" + text + "}"
+    elif rng.random() < 0.1:
+        text = "[" + text + "]"
+    return text
+
+
+def random_edits(rng, text, count=10):
+    """타이핑하듯 프롬프트를 조금씩 수정한 문자열 목록"""
+    history = [text]
+    for _ in range(count):
+        i = rng.randint(0, len(text))
+        r = rng.random()
+        if r < 0.4:
+            text = text[:i] + rng.choice(["a", ",", " ", "{", "}", "[", "]", "_"]) + text[i:]
+        elif r < 0.7:
+            text = text[:i] + ", " + rng.choice(WORD_LIST) + text[i:]
+        else:
+            text = text[:i] + text[i + rng.randint(1, 8):]
+        history.append(text)
+    return history
+
+
+def random_nai_comment(rng):
+    comment = {"prompt": random_prompt(rng, 20), "uc": random_prompt(rng, 10)}
+    for key, value in [("steps", rng.randint(1, 50)), ("scale", rng.choice([5, 5.5, 11])),
+                       ("seed", rng.randint(0, 2 ** 32)), ("sampler", "k_euler"),
+                       ("width", 832), ("height", 1216), ("sm", rng.random() < 0.5),
+                       ("cfg_scale", 7), ("strength", 0.7), ("noise", 0.2),
+                       ("request_type", "PromptGenerateRequest")]:
+        if rng.random() < 0.7:
+            comment[key] = value
+    if rng.random() < 0.1:
+        comment["uc"] = None
+    return comment
+
+
+def random_webui_parameters(rng):
+    lines = [random_prompt(rng, 20)]
+    if rng.random() < 0.2:
+        lines.append(random_prompt(rng, 5))
+    if rng.random() < 0.8:
+        lines.append("Negative prompt: " + random_prompt(rng, 10))
+        options = ["Steps: %d" % rng.randint(1, 50), "Sampler: Euler a",
+                   "CFG scale: %s" % rng.choice(["7", "7.5"]), "Seed: %d" % rng.randint(0, 2 ** 32),
+                   "Size: 512x768", "Model hash: abc123", "Model: foo", "Clip skip: 2",
+                   "Denoising strength: 0.4", "Schedule type: Karras", "Version: v1.10",
+                   "Hires upscale: 2", "ADetailer", "Lora hashes: \"x: 1\""]
+        rng.shuffle(options)
+        lines.append(", ".join(options[:rng.randint(0, len(options))]))
+    return "\n".join(lines)
+
+
+def random_info(rng):
+    """img.info처럼 생긴 랜덤 dict (없으면 None)"""
+    r = rng.random()
+    if r < 0.15:
+        return None
+    if r < 0.45:
+        return {"Software": "NovelAI", "Comment": json.dumps(random_nai_comment(rng))}
+    if r < 0.75:
+        return {"parameters": random_webui_parameters(rng)}
+    if r < 0.85:
+        return {"Comment": rng.choice(["not json", "null", "{}", "[]"])}
+    return {"Title": "x", "steps": str(rng.randint(1, 9))}
+
+
+def random_infostr(rng):
+    """img.info를 json.dumps한 문자열처럼 생긴 랜덤 입력"""
+    if rng.random() < 0.05:
+        return rng.choice(["not json", "[1, 2]", "{"])
+    info = random_info(rng)
+    return json.dumps(info) if info is not None else None
+
+
+def random_exifdict(rng):
+    """_get_naidict_from_exifdict에 들어가는 랜덤 dict (NAI Comment, WebUI 파싱 결과, 기타)"""
+    r = rng.random()
+    if r < 0.4:
+        return random_nai_comment(rng)
+    if r < 0.8:
+        return reference.parse_webui_exif(random_webui_parameters(rng))
+    exif_dict = {"Title": "x", "prompt": rng.choice([None, "", " a "]),
+                 "negative_prompt": rng.choice([None, "b"])}
+    if rng.random() < 0.5:
+        exif_dict["uc"] = rng.choice([None, "", "c"])
+    return exif_dict
+
+
+def random_image_file(rng, target_dir, name, kind=None):
+    """
+    텍스트 청크와 랜덤 stealth payload를 가진 PNG 파일을 만들고 (경로, payload)를 반환.
+    kind="text"면 텍스트 청크의 NAI Comment로 결과가 정해지는 파일,
+    kind="stealth"면 stealth pnginfo를 읽어야 결과가 정해지는 파일을 만듦.
+    PNG 형식은 PNG_FORMATS에서 고르며 (인터레이스, 16비트, 팔레트/L/LA,
+    IDAT 뒤의 텍스트 청크, pHYs/iCCP), 일부는 mmap 방식에서 Image.open으로 넘어감
+    """
+    from PIL import Image, PngImagePlugin
+
+    mode = rng.choice(["alpha", "rgb", None])
+    img_mode = "RGB" if mode == "rgb" else "RGBA"
+    size = (rng.choice([64, 128, 200]), rng.choice([64, 128, 300]))
+    if rng.random() < 0.5:
+        # 노이즈는 압축되지 않으므로 실제 이미지처럼 디코딩 비용이 듦
+        img = Image.frombytes(img_mode, size, rng.randbytes(size[0] * size[1] * len(img_mode)))
+    else:
+        img = Image.new(img_mode, size, tuple(rng.randrange(256) for _ in img_mode))
+
+    payload = None
+    if mode:
+        r = rng.random()
+        if r < 0.4:
+            payload = json.dumps({"Comment": json.dumps(random_nai_comment(rng))})
+        elif r < 0.7:
+            payload = json.dumps({"parameters": random_webui_parameters(rng)})
+        else:
+            payload = random_prompt(rng, 10) or "1girl"
+        try:
+            write_info_to_image_stealth(img, payload, mode, rng.random() < 0.5)
+        except ValueError:
+            payload = None
+
+    pnginfo = PngImagePlugin.PngInfo()
+    if kind == "text":
+        info = {"Software": "NovelAI", "Comment": json.dumps(random_nai_comment(rng))}
+    else:
+        info = random_info(rng)
+        while kind == "stealth" and info and "Software" in info:
+            info = random_info(rng)
+    if info:
+        for key, value in info.items():
+            r = rng.random()
+            if r < 0.6:
+                pnginfo.add_text(key, value)
+            elif r < 0.8:
+                pnginfo.add_text(key, value, zip=True)
+            else:
+                pnginfo.add_itxt(key, value, zip=rng.random() < 0.5)
+
+    # mmap 방식이 직접 읽는 경우와 Image.open으로 넘기는 경우를 모두 포함
+    if kind == "stealth":
+        png_format = rng.choice([f for f in PNG_FORMATS if f in STEALTH_PNG_FORMATS])
+    else:
+        png_format = rng.choice(PNG_FORMATS)
+    if png_format not in STEALTH_PNG_FORMATS:
+        payload = None
+    if png_format == "post_idat":
+        pnginfo.chunks = [(cid, data, True) for cid, data, *_ in pnginfo.chunks]
+    elif png_format == "palette":
+        img = img.convert("RGB").convert("P")
+    elif png_format in ("L", "LA"):
+        img = img.convert(png_format)
+
+    path = os.path.join(target_dir, "%s.png" % name)
+    if png_format in ("interlace", "16bit"):
+        _write_png(path, img, pnginfo.chunks,
+                   interlace=png_format == "interlace", bit16=png_format == "16bit")
+    elif png_format == "pHYs":
+        img.save(path, pnginfo=pnginfo, compress_level=1, dpi=(72, 72))
+    elif png_format == "iCCP":
+        img.save(path, pnginfo=pnginfo, compress_level=1, icc_profile=b"not a real icc profile")
+    else:
+        img.save(path, pnginfo=pnginfo, compress_level=1)
+    return path, payload
+
+
+PNG_FORMATS = ["plain", "plain", "plain", "post_idat", "interlace", "16bit",
+               "palette", "L", "LA", "pHYs", "iCCP"]
+# stealth payload가 그대로 남는 형식
+STEALTH_PNG_FORMATS = {"plain", "post_idat", "interlace", "16bit", "pHYs", "iCCP"}
+
+PNG_COLOR_TYPES = {"L": 0, "RGB": 2, "LA": 4, "RGBA": 6}
+# (x 시작, y 시작, x 간격, y 간격)
+ADAM7_PASSES = [(0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4),
+                (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2)]
+
+
+def _png_chunk(cid, data):
+    return struct.pack(">I", len(data)) + cid + data + struct.pack(">I", zlib.crc32(cid + data))
+
+
+def _write_png(path, img, chunks, interlace=False, bit16=False):
+    """
+    PIL이 저장하지 못하는 인터레이스(Adam7) 또는 16비트 PNG를 직접 기록.
+    16비트 샘플은 8비트 값 v를 v * 257로 늘려서 상위 바이트가 원래 값과 같음
+    """
+    width, height = img.size
+    channels = len(img.mode)
+    data = img.tobytes()
+    if bit16:
+        data = bytes(b for v in data for b in (v, v))
+    bpp = channels * (2 if bit16 else 1)
+
+    def rows(x0, y0, dx, dy):
+        raw = bytearray()
+        for y in range(y0, height, dy):
+            line = data[y * width * bpp:(y + 1) * width * bpp]
+            pixels = b"".join(line[x * bpp:(x + 1) * bpp] for x in range(x0, width, dx))
+            if pixels:
+                raw += b"\0" + pixels
+        return raw
+
+    if interlace:
+        raw = b"".join(rows(*adam7) for adam7 in ADAM7_PASSES)
+    else:
+        raw = rows(0, 0, 1, 1)
+
+    header = struct.pack(">IIBBBBB", width, height, 16 if bit16 else 8,
+                         PNG_COLOR_TYPES[img.mode], 0, 0, 1 if interlace else 0)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header))
+        for cid, chunk_data, *after_idat in chunks:
+            if not (after_idat and after_idat[0]):
+                f.write(_png_chunk(cid, chunk_data))
+        f.write(_png_chunk(b"IDAT", zlib.compress(bytes(raw), 1)))
+        for cid, chunk_data, *after_idat in chunks:
+            if after_idat and after_idat[0]:
+                f.write(_png_chunk(cid, chunk_data))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+# ---------------------------------------------------------------------------
+# 기준 구현(conformance_reference)과 실제 구현
+
+def reference_convert_edits(history):
+    return [reference.calculate_w_values(text) for text in history]
+
+
+def optimized_convert_edits(history):
+    converter = prompt_converter.IncrementalConverter()
+    return [converter.convert(text) for text in history]
+
+
+def optimized_naidict_from_infostr(exif, pnginfo):
+    return NaiDictGetter.get_result_from_infostr(exif, lambda: pnginfo)
+
+
+def _open_image(path):
+    from PIL import Image
+
+    img = Image.open(path)
+    img.load()
+    return img
+
+
+# 팔레트/L/LA 이미지에서 두 구현은 서로 다른 예외를 발생시키지만 호출하는 쪽은
+# 모두 예외를 None으로 처리하므로, 호출하는 함수의 결과를 비교
+def reference_stealth(item):
+    return reference._get_infostr_from_img(_open_image(item[0]))[1]
+
+
+def optimized_stealth(item):
+    return NaiDictGetter.get_pnginfo_from_img(_open_image(item[0]))
+
+
+def reference_naidict_from_file(item):
+    return reference.get_naidict_from_file(item[0])
+
+
+def optimized_naidict_from_file(item):
+    return NaiDictGetter.get_naidict_from_file(item[0])
+
+
+def bulk_naidict_from_file(item):
+    import bulk_reader
+    return bulk_reader.get_result_from_file(item[0]).to_legacy()
+
+
+def check_stealth_payload(item, result):
+    """파일에 기록한 stealth payload를 그대로 읽었는지 확인"""
+    path, payload = item
+    if payload is not None and result != payload:
+        return "stealth payload mismatch: %r != %r" % (result, payload)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# 실행
+
+class ConformanceCase:
+    """기준 구현과 최적화 구현을 같은 입력으로 실행하여 결과와 시간을 비교"""
+
+    def __init__(self, name, generate, reference, optimized, check=None, unpack=False,
+                 normalize=None):
+        self.name = name
+        self.generate = generate
+        self.reference = reference
+        self.optimized = optimized
+        self.check = check
+        self.unpack = unpack
+        # 최적화 구현의 결과를 비교 가능한 형태로 바꾸는 함수 (시간 측정에서 제외)
+        self.normalize = normalize
+
+    def call(self, func, item):
+        return func(*item) if self.unpack else func(item)
+
+
+def build_cases(target_dir):
+    def image_file(kind=None):
+        return lambda rng, i: random_image_file(rng, target_dir, "%s_%04d" % (kind, i), kind)
+
+    return [
+        # prompt_converter
+        ConformanceCase("calculate_w_values", lambda rng, i: random_prompt(rng),
+                        reference.calculate_w_values, prompt_converter.calculate_w_values),
+        ConformanceCase("incremental_convert",
+                        lambda rng, i: random_edits(rng, random_prompt(rng)),
+                        reference_convert_edits, optimized_convert_edits),
+        # NaiDictGetter
+        ConformanceCase("parse_webui_exif", lambda rng, i: random_webui_parameters(rng),
+                        reference.parse_webui_exif, NaiDictGetter.parse_webui_exif),
+        ConformanceCase("naidict_from_exifdict", lambda rng, i: random_exifdict(rng),
+                        reference._get_naidict_from_exifdict,
+                        NaiDictGetter._get_naidict_from_exifdict),
+        ConformanceCase("naidict_from_infostr",
+                        lambda rng, i: (random_infostr(rng), random_infostr(rng)),
+                        reference.naidict_from_infostr, optimized_naidict_from_infostr,
+                        unpack=True, normalize=NaiDictGetter.NaiResult.to_legacy),
+        # stealth_pnginfo
+        ConformanceCase("stealth", image_file(),
+                        reference_stealth, optimized_stealth, check=check_stealth_payload),
+        # 파일 전체 처리 (Image.open + img.load() 방식, mmap 방식)
+        ConformanceCase("naidict_from_file", image_file(),
+                        reference_naidict_from_file, optimized_naidict_from_file),
+        ConformanceCase("bulk_mixed", image_file(),
+                        reference_naidict_from_file, bulk_naidict_from_file),
+        ConformanceCase("bulk_text_chunk", image_file("text"),
+                        reference_naidict_from_file, bulk_naidict_from_file),
+        ConformanceCase("bulk_stealth", image_file("stealth"),
+                        reference_naidict_from_file, bulk_naidict_from_file),
+    ]
+
+
+def _timed(func, items):
+    results = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for item in items:
+            results.append(func(item))
+    return results, time.perf_counter() - start
+
+
+def run_case(case, seed, count, budget):
+    rng = random.Random("%s-%d" % (case.name, seed))
+    items = [case.generate(rng, i) for i in range(count)]
+
+    ref_results, ref_time = _timed(lambda item: case.call(case.reference, item), items)
+    opt_results, opt_time = _timed(lambda item: case.call(case.optimized, item), items)
+    if case.normalize:
+        opt_results = [case.normalize(result) for result in opt_results]
+
+    failures = []
+    for i, (item, ref, opt) in enumerate(zip(items, ref_results, opt_results)):
+        if ref != opt:
+            failures.append("input #%d differs\n  input: %.300r\n  reference: %.300r\n  optimized: %.300r"
+                            % (i, item, ref, opt))
+        if case.check:
+            error = case.check(item, opt)
+            if error:
+                failures.append("input #%d: %s" % (i, error))
+
+    speedup = ref_time / opt_time if opt_time > 0 else float("inf")
+    limit = budget.get(case.name, {})
+    if "max_seconds" in limit and opt_time > limit["max_seconds"]:
+        failures.append("optimized took %.3fs, budget is %.3fs" % (opt_time, limit["max_seconds"]))
+    if "min_speedup" in limit and speedup < limit["min_speedup"]:
+        failures.append("speedup %.2fx is below budget %.2fx" % (speedup, limit["min_speedup"]))
+
+    return {
+        "name": case.name,
+        "count": count,
+        "reference_seconds": ref_time,
+        "optimized_seconds": opt_time,
+        "speedup": speedup,
+        "failures": failures,
+    }
+
+
+def run(seed=0, count=200, budget=None, case_names=None):
+    """모든 케이스를 실행하고 케이스별 결과 dict 목록을 반환"""
+    budget = PERF_BUDGET if budget is None else budget
+    reports = []
+    with tempfile.TemporaryDirectory() as target_dir:
+        for case in build_cases(target_dir):
+            if case_names and case.name not in case_names:
+                continue
+            reports.append(run_case(case, seed, count, budget))
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Differential conformance and performance check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--case", action="append", help="run only the named case")
+    parser.add_argument("--budget", help="json file overriding PERF_BUDGET")
+    parser.add_argument("--report", help="write the results as json")
+    args = parser.parse_args(argv)
+
+    budget = PERF_BUDGET
+    if args.budget:
+        with open(args.budget, encoding="utf-8") as f:
+            budget = json.load(f)
+
+    reports = run(args.seed, args.count, budget, args.case)
+
+    failed = False
+    for report in reports:
+        status = "FAIL" if report["failures"] else "ok"
+        print("%-22s %4s  reference %8.3fs  optimized %8.3fs  speedup %7.2fx"
+              % (report["name"], status, report["reference_seconds"],
+                 report["optimized_seconds"], report["speedup"]))
+        for failure in report["failures"][:10]:
+            for line in failure.splitlines():
+                print("    " + line)
+        failed = failed or bool(report["failures"])
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"seed": args.seed, "cases": reports}, f, indent=4)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
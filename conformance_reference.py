@@ -0,0 +1,504 @@
+"""
+conformance.py에서 기준 구현으로 사용하는 기존 구현의 원본 복사본.
+실제 모듈을 최적화해도 이 모듈은 바뀌지 않아야 비교가 의미가 있으므로 수정하지 않음.
+"""
+from PIL import Image
+import gzip
+import json
+import re
+
+
+# ---- stealth_pnginfo.py
+
+# from https://github.com/neggles/sd-webui-stealth-pnginfo/
+def read_info_from_image_stealth(image):
+    # trying to read stealth pnginfo
+    width, height = image.size
+    pixels = image.load()
+
+    has_alpha = True if image.mode == 'RGBA' else False
+    mode = None
+    compressed = False
+    binary_data = ''
+    buffer_a = ''
+    buffer_rgb = ''
+    index_a = 0
+    index_rgb = 0
+    sig_confirmed = False
+    confirming_signature = True
+    reading_param_len = False
+    reading_param = False
+    read_end = False
+    for x in range(width):
+        for y in range(height):
+            if has_alpha:
+                r, g, b, a = pixels[x, y]
+                buffer_a += str(a & 1)
+                index_a += 1
+            else:
+                r, g, b = pixels[x, y]
+            buffer_rgb += str(r & 1)
+            buffer_rgb += str(g & 1)
+            buffer_rgb += str(b & 1)
+            index_rgb += 3
+            if confirming_signature:
+                if index_a == len('stealth_pnginfo') * 8:
+                    decoded_sig = bytearray(int(buffer_a[i:i + 8], 2) for i in
+                                            range(0, len(buffer_a), 8)).decode('utf-8', errors='ignore')
+                    if decoded_sig in {'stealth_pnginfo', 'stealth_pngcomp'}:
+                        confirming_signature = False
+                        sig_confirmed = True
+                        reading_param_len = True
+                        mode = 'alpha'
+                        if decoded_sig == 'stealth_pngcomp':
+                            compressed = True
+                        buffer_a = ''
+                        index_a = 0
+                    else:
+                        read_end = True
+                        break
+                elif index_rgb == len('stealth_pnginfo') * 8:
+                    decoded_sig = bytearray(int(buffer_rgb[i:i + 8], 2) for i in
+                                            range(0, len(buffer_rgb), 8)).decode('utf-8', errors='ignore')
+                    if decoded_sig in {'stealth_rgbinfo', 'stealth_rgbcomp'}:
+                        confirming_signature = False
+                        sig_confirmed = True
+                        reading_param_len = True
+                        mode = 'rgb'
+                        if decoded_sig == 'stealth_rgbcomp':
+                            compressed = True
+                        buffer_rgb = ''
+                        index_rgb = 0
+            elif reading_param_len:
+                if mode == 'alpha':
+                    if index_a == 32:
+                        param_len = int(buffer_a, 2)
+                        reading_param_len = False
+                        reading_param = True
+                        buffer_a = ''
+                        index_a = 0
+                else:
+                    if index_rgb == 33:
+                        pop = buffer_rgb[-1]
+                        buffer_rgb = buffer_rgb[:-1]
+                        param_len = int(buffer_rgb, 2)
+                        reading_param_len = False
+                        reading_param = True
+                        buffer_rgb = pop
+                        index_rgb = 1
+            elif reading_param:
+                if mode == 'alpha':
+                    if index_a == param_len:
+                        binary_data = buffer_a
+                        read_end = True
+                        break
+                else:
+                    if index_rgb >= param_len:
+                        diff = param_len - index_rgb
+                        if diff < 0:
+                            buffer_rgb = buffer_rgb[:diff]
+                        binary_data = buffer_rgb
+                        read_end = True
+                        break
+            else:
+                # impossible
+                read_end = True
+                break
+        if read_end:
+            break
+    if sig_confirmed and binary_data != '':
+        # Convert binary string to UTF-8 encoded text
+        byte_data = bytearray(int(binary_data[i:i + 8], 2)
+                              for i in range(0, len(binary_data), 8))
+        try:
+            if compressed:
+                decoded_data = gzip.decompress(
+                    bytes(byte_data)).decode('utf-8')
+            else:
+                decoded_data = byte_data.decode('utf-8', errors='ignore')
+            return decoded_data
+        except Exception as e:
+            print(e)
+            pass
+
+    return None
+
+
+# ---- prompt_converter.py
+
+def split_tokens(text):
+    """
+    Split original string by commas,
+    return tokens and their start/end positions
+    """
+    tokens = []
+    start = 0
+    for i, ch in enumerate(text):
+        if ch == ',':
+            token = text[start:i]
+            if token.strip():
+                tokens.append((token, start, i-1))
+            start = i + 1
+    if start < len(text):
+        token = text[start:]
+        if token.strip():
+            tokens.append((token, start, len(text)-1))
+    return tokens
+
+def find_word_bounds(token, token_offset):
+    """
+    Get word bounds inside a token, ignoring spaces and brackets
+    Returns the actual start, end index (based on original string)
+    """
+    # Left to right search: skip spaces and { } [ ]
+    left = 0
+    while left < len(token) and token[left] in " \t{}[]":
+        left += 1
+    # Right to left search
+    right = len(token) - 1
+    while right >= 0 and token[right] in " \t{}[]":
+        right -= 1
+    if left > right:
+        # If no word, use the entire token
+        return token_offset, token_offset + len(token) - 1
+    return token_offset + left, token_offset + right
+
+def count_before(text, pos, target, stopper):
+    """
+    Count occurrences of target character to the left of pos,
+    stopping at stopper character
+    """
+    count = 0
+    i = pos - 1
+    while i >= 0:
+        if text[i] == stopper:
+            break
+        if text[i] == target:
+            count += 1
+        i -= 1
+    return count
+
+def count_after(text, pos, target, stopper):
+    """
+    Count occurrences of target character to the right of pos,
+    stopping at stopper character
+    """
+    count = 0
+    i = pos + 1
+    while i < len(text):
+        if text[i] == stopper:
+            break
+        if text[i] == target:
+            count += 1
+        i += 1
+    return count
+
+def calculate_w_values(text):
+    """
+    Convert NAI prompt style to WebUI format with weights
+    """
+    # Replace underscores with spaces
+    text = text.replace('_', ' ')
+    
+    tokens = split_tokens(text)
+    results = []
+    
+    # Global bracket adjustment
+    stripped = text.strip()
+    global_curly_adj = 1 if (stripped.startswith('{') and stripped.endswith('}')) else 0
+    global_square_adj = 1 if (stripped.startswith('[') and stripped.endswith(']')) else 0
+
+    for token, t_start, t_end in tokens:
+        word_start, word_end = find_word_bounds(token, t_start)
+        # P-O: Count '{' to the left (stop at '}')
+        p_o = count_before(text, word_start, '{', '}')
+        # P-C: Count '}' to the right (stop at '{')
+        p_c = count_after(text, word_end, '}', '{')
+        p_w = max(p_o, p_c)
+        if global_curly_adj:
+            p_w = max(p_w - 1, 0)
+        
+        # N-O: Count '[' to the left (stop at ']')
+        n_o = count_before(text, word_start, '[', ']')
+        # N-C: Count ']' to the right (stop at '[')
+        n_c = count_after(text, word_end, ']', '[')
+        n_w = max(n_o, n_c)
+        if global_square_adj:
+            n_w = max(n_w - 1, 0)
+        
+        # Calculate weight
+        lw = p_w - n_w
+        w = 1.0
+        if lw > 0:
+            for _ in range(lw):
+                w *= 1.05
+        elif lw < 0:
+            for _ in range(abs(lw)):
+                w *= 0.95
+        w = round(w + 1e-8, 2)
+        
+        # Clean token: remove brackets and trim
+        cleaned = re.sub(r'[{}\[\]]', '', token).strip()
+        if not cleaned:
+            continue
+        if abs(w - 1.0) < 1e-8:
+            results.append(cleaned)
+        else:
+            results.append(f"({cleaned}:{w:.2f})")
+            
+    return ", ".join(results)
+
+
+# ---- NaiDictGetter.py
+
+TARGETKEY_NAIDICT_OPTION = ("steps", "height", "width",
+                            "scale", "seed", "sampler", "n_samples", "sm", "sm_dyn",
+                            # WebUI options
+                            "cfg scale", "cfg_scale", "clip skip", "clip_skip", "schedule type", "schedule_type", 
+                            "size", "model", "model hash", "model_hash", "denoising strength", "denoising_strength")
+
+WEBUI_OPTION_MAPPING = {
+    "cfg scale": "scale",
+    "cfg_scale": "scale",
+    "clip skip": "clip_skip",
+    "clip_skip": "clip_skip",
+    "schedule type": "schedule_type",
+    "schedule_type": "schedule_type",
+    "model hash": "model_hash",
+    "model_hash": "model_hash",
+    "denoising strength": "denoising_strength",
+    "denoising_strength": "denoising_strength"
+}
+
+def _get_infostr_from_img(img):
+    exif = None
+    pnginfo = None
+
+    # exif
+    if img.info:
+        try:
+            exif = json.dumps(img.info)
+        except Exception as e:
+            print(e)
+
+    # stealth pnginfo
+    try:
+        pnginfo = read_info_from_image_stealth(img)
+    except Exception as e:
+        print(e)
+
+    return exif, pnginfo
+
+def is_nai_exif(info_str):
+    """nai 이미지면 exif의 원본 JSON에 'Comment' 키가 존재하고 None이 아닌 경우 True를 반환"""
+    if not info_str:
+        return False
+    try:
+        data = json.loads(info_str)
+        return 'Comment' in data and data['Comment'] is not None
+    except Exception as e:
+        return False
+
+def _get_exifdict_from_infostr(info_str):
+    if not info_str:
+        return None
+    try:
+        data = json.loads(info_str)
+        # WebUI 형식의 경우 'parameters' 키가 존재함
+        if 'parameters' in data:
+            return parse_webui_exif(data['parameters'])
+        # nai 이미지라면 여기서 처리하지 않고 get_naidict_from_img에서 old 방식으로 처리함
+        elif 'Comment' in data:
+            return None
+        else:
+            return data
+    except Exception as e:
+        print("EXIF dictionary conversion error:", e)
+        return None
+
+def parse_webui_exif(parameters_str):
+    """
+    WebUI EXIF의 'parameters' 문자열을 파싱합니다.
+    """
+    lines = parameters_str.splitlines()
+    if not lines:
+        return {}
+    
+    # Negative prompt 라인을 찾음
+    neg_prompt_index = -1
+    for i, line in enumerate(lines):
+        if line.strip().startswith("Negative prompt:"):
+            neg_prompt_index = i
+            break
+    
+    # 프롬프트 추출 (Negative prompt 전까지의 모든 줄)
+    if neg_prompt_index > 0:
+        prompt = "\n".join(lines[:neg_prompt_index]).strip()
+        negative_prompt = lines[neg_prompt_index][len("Negative prompt:"):].strip()
+        option_lines = lines[neg_prompt_index+1:]
+    else:
+        # Negative prompt가 없는 경우
+        prompt = "\n".join(lines).strip()
+        negative_prompt = ""
+        option_lines = []
+    
+    options = {}
+    etc = {}
+    
+    # 옵션 파싱
+    for line in option_lines:
+        line = line.strip()
+        parts = line.split(',')
+        for part in parts:
+            part = part.strip()
+            if ':' in part:
+                key, value = part.split(':', 1)
+                key = key.strip().lower()
+                value = value.strip()
+                
+                # 숫자 변환 시도
+                try:
+                    if '.' in value:
+                        value = float(value)
+                    else:
+                        value = int(value)
+                except:
+                    pass
+                
+                if key in WEBUI_OPTION_MAPPING:
+                    key = WEBUI_OPTION_MAPPING[key]
+                
+                if key.lower() in [k.lower() for k in TARGETKEY_NAIDICT_OPTION]:
+                    options[key] = value
+                else:
+                    etc[key] = value
+            elif part:
+                etc[part] = ""
+    
+    return {
+        "prompt": prompt,
+        "uc": negative_prompt,  # NAI 호환을 위해 "uc" 사용
+        "negative_prompt": negative_prompt,  # WebUI 표준 키도 유지
+        **options,  # 옵션 평탄화
+        **etc  # 기타 필드 평탄화
+    }
+
+def _get_naidict_from_exifdict(exif_dict):
+    try:
+        nai_dict = {}
+        
+        # 프롬프트 처리 (None인 경우 빈 문자열로)
+        nai_dict["prompt"] = (exif_dict.get("prompt") or "").strip()
+        
+        # 네거티브 프롬프트 처리
+        if "uc" in exif_dict and exif_dict.get("uc") is not None:
+            nai_dict["negative_prompt"] = (exif_dict.get("uc") or "").strip()
+        elif "negative_prompt" in exif_dict and exif_dict.get("negative_prompt") is not None:
+            nai_dict["negative_prompt"] = (exif_dict.get("negative_prompt") or "").strip()
+        else:
+            nai_dict["negative_prompt"] = ""
+        
+        # 옵션 추출
+        option_dict = {}
+        for key in TARGETKEY_NAIDICT_OPTION:
+            if key in exif_dict and exif_dict[key] is not None:
+                option_dict[key] = exif_dict[key]
+        
+        # WebUI 옵션 매핑
+        for webui_key, nai_key in WEBUI_OPTION_MAPPING.items():
+            if webui_key in exif_dict and exif_dict[webui_key] is not None:
+                option_dict[nai_key] = exif_dict[webui_key]
+        
+        nai_dict["option"] = option_dict
+        
+        # 기타 정보 처리
+        etc_dict = {}
+        excluded_keys = list(TARGETKEY_NAIDICT_OPTION) + ["prompt", "uc", "negative_prompt"]
+        excluded_keys.extend(WEBUI_OPTION_MAPPING.keys())
+        
+        for key in exif_dict.keys():
+            if key not in excluded_keys:
+                etc_dict[key] = exif_dict[key]
+        
+        nai_dict["etc"] = etc_dict
+        
+        return nai_dict
+    except Exception as e:
+        print("Error in _get_naidict_from_exifdict:", e)
+    return None
+
+def get_naidict_from_file(src):
+    try:
+        img = Image.open(src)
+        img.load()
+    except Exception as e:
+        print(e)
+        return None, 0
+    return get_naidict_from_img(img)
+
+def get_naidict_from_img(img):
+    exif, pnginfo = _get_infostr_from_img(img)
+    if not exif and not pnginfo:
+        return None, 0
+
+    # 먼저 nai 이미지 여부를 검사하여, nai 이미지면 old 방식으로 처리
+    for info_str in [exif, pnginfo]:
+        if is_nai_exif(info_str):
+            try:
+                data = json.loads(info_str)
+                nai_exif = json.loads(data['Comment'])
+                nd = _get_naidict_from_exifdict(nai_exif)
+                if nd:
+                    return nd, 3
+            except Exception as e:
+                print("Error in nai old method extraction:", e)
+
+    # nai 이미지가 아니라면 WebUI 방식(new)으로 처리
+    ed1 = _get_exifdict_from_infostr(exif)
+    ed2 = _get_exifdict_from_infostr(pnginfo)
+    if not ed1 and not ed2:
+        return exif or pnginfo, 1
+
+    nd1 = _get_naidict_from_exifdict(ed1) if ed1 else None
+    nd2 = _get_naidict_from_exifdict(ed2) if ed2 else None
+    if not nd1 and not nd2:
+        return exif or pnginfo, 2
+
+    if nd1:
+        return nd1, 3
+    else:
+        return nd2, 3
+
+
+# get_naidict_from_img에서 _get_infostr_from_img 이후의 분기 로직 (원본 그대로)
+def naidict_from_infostr(exif, pnginfo):
+    if not exif and not pnginfo:
+        return None, 0
+
+    # 먼저 nai 이미지 여부를 검사하여, nai 이미지면 old 방식으로 처리
+    for info_str in [exif, pnginfo]:
+        if is_nai_exif(info_str):
+            try:
+                data = json.loads(info_str)
+                nai_exif = json.loads(data['Comment'])
+                nd = _get_naidict_from_exifdict(nai_exif)
+                if nd:
+                    return nd, 3
+            except Exception as e:
+                print("Error in nai old method extraction:", e)
+
+    # nai 이미지가 아니라면 WebUI 방식(new)으로 처리
+    ed1 = _get_exifdict_from_infostr(exif)
+    ed2 = _get_exifdict_from_infostr(pnginfo)
+    if not ed1 and not ed2:
+        return exif or pnginfo, 1
+
+    nd1 = _get_naidict_from_exifdict(ed1) if ed1 else None
+    nd2 = _get_naidict_from_exifdict(ed2) if ed2 else None
+    if not nd1 and not nd2:
+        return exif or pnginfo, 2
+
+    if nd1:
+        return nd1, 3
+    else:
+        return nd2, 3
@@ -1,4 +1,5 @@
 import json
+import os
 import sys
 import time
 
@@ -10,10 +11,12 @@ from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QFileDialog, QLa
 from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QPushButton, QProgressBar, QMessageBox, QDialog
 from PyQt5.QtWidgets import QScrollArea  # 추가됨
 from PyQt5.QtGui import QIcon, QPixmap, QImage
-from PyQt5.QtCore import QSettings, QPoint, QSize, QCoreApplication
+from PyQt5.QtCore import Qt, QSettings, QPoint, QSize, QCoreApplication, QTimer
 
 import NaiDictGetter
-from prompt_converter import calculate_w_values
+from NaiDictGetter import NaiStatus
+from prompt_converter import IncrementalConverter
+from view_cache import ViewCache, ViewHistory, file_stamp
 
 TITLE_NAME = "NAI Image Tag Viewer(with webui)"
 TOP_NAME = "dcp_arca"
@@ -28,6 +31,13 @@ LABEL_TEXT_LIST = ["프롬프트(Prompt)",
 
 TEXTEDIT_HINT = "버튼 클릭 또는 아무 곳에 드래그 드랍하여 불러오기"
 
+CONVERT_DEBOUNCE_MS = 300
+
+# 최근 본 이미지 캐시 (개수, 바이트) 제한과 캐시에 보관할 표시용 이미지 크기
+VIEW_CACHE_MAX_ENTRIES = 32
+VIEW_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DISPLAY_PIXMAP_SIZE = 1024
+
 
 def prettify_dict(d):
     return json.dumps(d, sort_keys=True, indent=4)
@@ -51,11 +61,28 @@ def pil2pixmap(im):
     return pixmap
 
 
+def make_display_pixmap(pixmap):
+    if pixmap.isNull():
+        return None
+    if pixmap.width() > DISPLAY_PIXMAP_SIZE or pixmap.height() > DISPLAY_PIXMAP_SIZE:
+        pixmap = pixmap.scaled(QSize(DISPLAY_PIXMAP_SIZE, DISPLAY_PIXMAP_SIZE),
+                               Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return pixmap
+
+
+def pixmap_nbytes(pixmap):
+    if pixmap is None:
+        return 0
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+
 class MyWidget(QMainWindow):
 
     def __init__(self, app):
         super().__init__()
         self.app = app
+        self.view_cache = ViewCache(VIEW_CACHE_MAX_ENTRIES, VIEW_CACHE_MAX_BYTES)
+        self.view_history = ViewHistory()
 
         self.init_window()
         self.init_content()
@@ -93,6 +120,26 @@ class MyWidget(QMainWindow):
         # Image section
         vbox_img = QVBoxLayout()
         vbox.addLayout(vbox_img)
+
+        # 이전/다음 이미지 이동 (Alt+Left / Alt+Right)
+        history_hbox = QHBoxLayout()
+        vbox_img.addLayout(history_hbox)
+        self.button_back = QPushButton("◀ 이전", self)
+        self.button_back.clicked.connect(self.show_prev_image)
+        history_hbox.addWidget(self.button_back)
+        self.button_forward = QPushButton("다음 ▶", self)
+        self.button_forward.clicked.connect(self.show_next_image)
+        history_hbox.addWidget(self.button_forward)
+
+        action_back = QAction(self)
+        action_back.setShortcut("Alt+Left")
+        action_back.triggered.connect(self.show_prev_image)
+        self.addAction(action_back)
+        action_forward = QAction(self)
+        action_forward.setShortcut("Alt+Right")
+        action_forward.triggered.connect(self.show_next_image)
+        self.addAction(action_forward)
+        self.update_history_buttons()
         button_img = QPushButton(TEXTEDIT_HINT, self)
         button_img.setMinimumSize(QSize(500, 500))
         button_img.clicked.connect(self.show_select_dialog)
@@ -136,6 +183,15 @@ QPushButton {
         copy_neg_button.clicked.connect(lambda: self.copy_to_clipboard(3))
         convert_hbox.addWidget(copy_neg_button)
         
+        # 프롬프트 수정 시 잠시 후 자동 변환
+        self.converter_list = [IncrementalConverter(), IncrementalConverter()]
+        self.convert_timer = QTimer(self)
+        self.convert_timer.setSingleShot(True)
+        self.convert_timer.setInterval(CONVERT_DEBOUNCE_MS)
+        self.convert_timer.timeout.connect(self.live_convert_prompts)
+        self.textedit_list[0].textChanged.connect(self.convert_timer.start)
+        self.textedit_list[1].textChanged.connect(self.convert_timer.start)
+
         # Converted prompt
         self.textedit_list.append(
             add_titletext_and_textedit(vbox, LABEL_TEXT_LIST[2], 10))  # stretch 값 조정
@@ -176,13 +232,23 @@ QPushButton {
             return
         
         # Convert and set the results
+        self.convert_timer.stop()
         if prompt:
-            converted_prompt = calculate_w_values(prompt)
-            self.textedit_list[2].setText(converted_prompt)
+            self._set_converted(0, prompt)
         
         if neg_prompt:
-            converted_neg_prompt = calculate_w_values(neg_prompt)
-            self.textedit_list[3].setText(converted_neg_prompt)
+            self._set_converted(1, neg_prompt)
+
+    def live_convert_prompts(self):
+        # 변경된 토큰만 다시 계산하므로 긴 프롬프트도 타이핑 중에 변환 가능
+        for index in range(2):
+            self._set_converted(index, self.textedit_list[index].toPlainText())
+
+    def _set_converted(self, index, text):
+        converted = self.converter_list[index].convert(text)
+        target = self.textedit_list[index + 2]
+        if target.toPlainText() != converted:
+            target.setText(converted)
 
     def copy_to_clipboard(self, index):
         clipboard = QApplication.clipboard()
@@ -193,35 +259,75 @@ QPushButton {
         else:
             QMessageBox.information(self, '알림', "복사할 내용이 없습니다.")
 
-    def execute_bystr(self, file_src):
-        nai_dict, error_code = NaiDictGetter.get_naidict_from_file(file_src)
-        print(nai_dict, error_code)
-
-        self._execute_byinfo(nai_dict, error_code, file_src)
+    def execute_bystr(self, file_src, add_history=True):
+        # 최근 본 이미지는 stat() 한 번으로 변경 여부만 확인하고 캐시에서 불러옴
+        key = os.path.abspath(file_src)
+        stamp = file_stamp(key)
+        cached = self.view_cache.get(key, stamp) if stamp else None
+        if cached:
+            result, pixmap = cached
+        else:
+            result = NaiDictGetter.get_result_from_file(file_src)
+            pixmap = (make_display_pixmap(QPixmap(file_src))
+                      if result.status == NaiStatus.OK else None)
+            if stamp:
+                self.view_cache.put(key, stamp, result, pixmap, pixmap_nbytes(pixmap))
+        print(result)
+
+        if add_history and result.status == NaiStatus.OK:
+            self.view_history.visit(key)
+            self.update_history_buttons()
+
+        self._execute_byinfo(result, pixmap if pixmap else file_src)
+        return result
+
+    def show_prev_image(self):
+        self._show_history_image(self.view_history.back(), forward=False)
+
+    def show_next_image(self):
+        self._show_history_image(self.view_history.forward(), forward=True)
+
+    def _show_history_image(self, key, forward):
+        if key:
+            result = self.execute_bystr(key, add_history=False)
+            # 삭제되었거나 읽을 수 없게 된 파일은 기록에서 제거
+            if result.status != NaiStatus.OK:
+                self.view_cache.pop(key)
+                self.view_history.remove_current(forward)
+                # 실패한 파일의 내용이 화면에 남지 않도록 되돌아간 이미지를 다시 표시
+                # (보통 캐시에 있으므로 파일을 다시 읽지 않음)
+                current = self.view_history.current
+                if current:
+                    self.execute_bystr(current, add_history=False)
+        self.update_history_buttons()
+
+    def update_history_buttons(self):
+        self.button_back.setEnabled(self.view_history.can_back())
+        self.button_forward.setEnabled(self.view_history.can_forward())
 
     def execute_byimg(self, img):
-        nai_dict, error_code = NaiDictGetter.get_naidict_from_img(img)
-        print(nai_dict, error_code)
+        result = NaiDictGetter.get_result_from_img(img)
+        print(result)
 
-        self._execute_byinfo(nai_dict, error_code, img)
+        self._execute_byinfo(result, img)
 
-    def _execute_byinfo(self, nai_dict, error_code, img_obj):
-        if error_code == 0:
+    def _execute_byinfo(self, result, img_obj):
+        if result.status == NaiStatus.NO_INFO:
             QMessageBox.information(self, '경고', "EXIF가 존재하지 않는 파일입니다.")
-        elif error_code == 1 or error_code == 2:
+        elif result.status in (NaiStatus.UNKNOWN_INFO, NaiStatus.PARSE_FAILED):
             QMessageBox.information(
                 self, '경고', "EXIF는 존재하나 NAI/WebUI로부터 만들어진 것이 아닌 듯 합니다.")
-            self.textedit_list[0].setText(str(nai_dict))
-        elif error_code == 3:
-            self.textedit_list[0].setText(nai_dict["prompt"])
-            self.textedit_list[1].setText(nai_dict["negative_prompt"])
+            self.textedit_list[0].setText(str(result.raw))
+        elif result.status == NaiStatus.OK:
+            self.textedit_list[0].setText(result.prompt)
+            self.textedit_list[1].setText(result.negative_prompt)
             
-            # Clear converted prompts when loading new image
+            # Clear converted prompts of the previous image; live conversion refills them
             self.textedit_list[2].clear()
             self.textedit_list[3].clear()
             
-            self.textedit_list[4].setText(prettify_dict(nai_dict["option"]))
-            self.textedit_list[5].setText(prettify_dict(nai_dict["etc"]))
+            self.textedit_list[4].setText(prettify_dict(result.option))
+            self.textedit_list[5].setText(prettify_dict(result.etc))
 
             self.button_img.setStyleSheet("""
                 padding: 5px;
@@ -233,6 +339,8 @@ QPushButton {
             """)
             if isinstance(img_obj, str):
                 qicon = QIcon(img_obj)
+            elif isinstance(img_obj, QPixmap):
+                qicon = QIcon(img_obj)
             else:
                 pixmap = pil2pixmap(img_obj)
                 qicon = QIcon(pixmap)
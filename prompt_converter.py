@@ -1,5 +1,7 @@
 import re
 
+_BRACKET_RE = re.compile(r'[{}\[\]]')
+
 def split_tokens(text):
     """
     Split original string by commas,
@@ -120,4 +122,202 @@ def calculate_w_values(text):
         else:
             results.append(f"({cleaned}:{w:.2f})")
             
-    return ", ".join(results)
\ No newline at end of file
+    return ", ".join(results)
+
+def _weight_text(lw):
+    """
+    Format the weight for a bracket level exactly like calculate_w_values
+    """
+    w = 1.0
+    if lw > 0:
+        for _ in range(lw):
+            w *= 1.05
+    elif lw < 0:
+        for _ in range(abs(lw)):
+            w *= 0.95
+    w = round(w + 1e-8, 2)
+    if abs(w - 1.0) < 1e-8:
+        return None
+    return f"{w:.2f}"
+
+
+def bracket_levels(text, bounds):
+    """
+    Compute the bracket level (p_w - n_w) of every word bound in one pass.
+    bounds must be sorted (word_start, word_end) pairs, as produced from
+    the non-overlapping spans of split_tokens.
+    Only bracket characters are visited, so plain tags cost nothing.
+    """
+    brackets = [(m.start(), m.group()) for m in _BRACKET_RE.finditer(text)]
+    count = len(bounds)
+    p_o = [0] * count
+    n_o = [0] * count
+
+    # P-O / N-O: brackets left of word_start, reset by the closing bracket
+    curly = square = 0
+    i = 0
+    for k, (word_start, _) in enumerate(bounds):
+        while i < len(brackets) and brackets[i][0] < word_start:
+            ch = brackets[i][1]
+            if ch == '{':
+                curly += 1
+            elif ch == '}':
+                curly = 0
+            elif ch == '[':
+                square += 1
+            else:
+                square = 0
+            i += 1
+        p_o[k] = curly
+        n_o[k] = square
+
+    stripped = text.strip()
+    global_curly_adj = 1 if (stripped.startswith('{') and stripped.endswith('}')) else 0
+    global_square_adj = 1 if (stripped.startswith('[') and stripped.endswith(']')) else 0
+
+    # P-C / N-C: brackets right of word_end, reset by the opening bracket
+    levels = [0] * count
+    curly = square = 0
+    j = len(brackets) - 1
+    for k in range(count - 1, -1, -1):
+        word_end = bounds[k][1]
+        while j >= 0 and brackets[j][0] > word_end:
+            ch = brackets[j][1]
+            if ch == '}':
+                curly += 1
+            elif ch == '{':
+                curly = 0
+            elif ch == ']':
+                square += 1
+            else:
+                square = 0
+            j -= 1
+        p_w = max(p_o[k], curly)
+        if global_curly_adj:
+            p_w = max(p_w - 1, 0)
+        n_w = max(n_o[k], square)
+        if global_square_adj:
+            n_w = max(n_w - 1, 0)
+        levels[k] = p_w - n_w
+    return levels
+
+
+def _common_prefix_len(a, b, limit):
+    """
+    Length of the common prefix of a and b (at most limit),
+    found by bisecting on slice comparisons
+    """
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _first_token_from(tokens, pos):
+    """
+    Index of the first token in split_tokens output starting at or after pos
+    """
+    lo, hi = 0, len(tokens)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if tokens[mid][1] < pos:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class IncrementalConverter:
+    """
+    Stateful calculate_w_values for live conversion while a prompt is edited.
+    Token spans outside the edited region are reused from the previous call,
+    and a token is only re-cleaned when its text changes.
+    The output is identical to calculate_w_values.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.tokens = []
+        # token text -> (word_left, word_right, cleaned), relative offsets
+        self._token_cache = {}
+        # (token text, level) -> converted piece or None
+        self._piece_cache = {}
+
+    def _retokenize(self, text):
+        old = self.text
+        old_tokens = self.tokens
+        if not old_tokens or not old:
+            return split_tokens(text)
+
+        if old == text:
+            return old_tokens
+
+        # Common prefix / suffix between the old and the new text
+        limit = min(len(old), len(text))
+        p = _common_prefix_len(old, text, limit)
+        s = _common_prefix_len(old[::-1], text[::-1], limit - p)
+        delta = len(text) - len(old)
+
+        # Re-split only the comma-separated segments touched by the edit
+        lo = text.rfind(',', 0, p) + 1
+        hi = text.find(',', len(text) - s)
+        head = old_tokens[:_first_token_from(old_tokens, lo)]
+        if hi == -1:
+            middle = split_tokens(text[lo:])
+            tail = []
+        else:
+            middle = split_tokens(text[lo:hi])
+            hi_old = hi - delta
+            tail_index = _first_token_from(old_tokens, hi_old + 1)
+            tail = [(token, start + delta, end + delta)
+                    for token, start, end in old_tokens[tail_index:]]
+        middle = [(token, start + lo, end + lo) for token, start, end in middle]
+        return head + middle + tail
+
+    def convert(self, text):
+        # Replace underscores with spaces (length preserving)
+        text = text.replace('_', ' ')
+        tokens = self._retokenize(text)
+
+        token_cache = {}
+        bounds = []
+        for token, t_start, _ in tokens:
+            info = token_cache.get(token) or self._token_cache.get(token)
+            if info is None:
+                word_start, word_end = find_word_bounds(token, 0)
+                cleaned = _BRACKET_RE.sub('', token).strip()
+                info = (word_start, word_end, cleaned)
+            token_cache[token] = info
+            bounds.append((t_start + info[0], t_start + info[1]))
+
+        levels = bracket_levels(text, bounds)
+
+        piece_cache = {}
+        results = []
+        for (token, _, _), lw in zip(tokens, levels):
+            key = (token, lw)
+            if key in piece_cache:
+                piece = piece_cache[key]
+            elif key in self._piece_cache:
+                piece = self._piece_cache[key]
+            else:
+                cleaned = token_cache[token][2]
+                if not cleaned:
+                    piece = None
+                else:
+                    w = _weight_text(lw)
+                    piece = cleaned if w is None else f"({cleaned}:{w})"
+            piece_cache[key] = piece
+            if piece is not None:
+                results.append(piece)
+
+        self.text = text
+        self.tokens = tokens
+        self._token_cache = token_cache
+        self._piece_cache = piece_cache
+        return ", ".join(results)
+
@@ -2,106 +2,92 @@ from PIL import Image
 import gzip
 
 
-# from https://github.com/neggles/sd-webui-stealth-pnginfo/
-def read_info_from_image_stealth(image):
-    # trying to read stealth pnginfo
+STEALTH_SIGNATURES = {
+    "stealth_pnginfo": ("alpha", False),
+    "stealth_pngcomp": ("alpha", True),
+    "stealth_rgbinfo": ("rgb", False),
+    "stealth_rgbcomp": ("rgb", True),
+}
+SIG_BITS = len("stealth_pnginfo") * 8
+
+# 바이트 -> 최하위 비트 문자('0' 또는 '1')
+_LSB_TABLE = bytes(0x30 | (i & 1) for i in range(256))
+
+
+def _bits_to_bytes(bits):
+    # 마지막 8비트 미만 조각도 그대로 한 바이트로 만듦 (원본과 동일)
+    full = len(bits) // 8 * 8
+    byte_data = bytearray(int(bits[:full], 2).to_bytes(full // 8, "big") if full else b"")
+    if full < len(bits):
+        byte_data.append(int(bits[full:], 2))
+    return byte_data
+
+
+def lsb_from_bytes(data, has_alpha):
+    """
+    픽셀 바이트(RGB 또는 RGBA)에서 (alpha 비트 문자열, rgb 비트 문자열)을 만듦
+    """
+    bits = data.translate(_LSB_TABLE)
+    if not has_alpha:
+        return "", bits.decode("ascii")
+    rgb = bytearray(bits)
+    del rgb[3::4]
+    return bits[3::4].decode("ascii"), rgb.decode("ascii")
+
+
+def image_lsb(image, count):
+    """
+    열 우선(x, 그 다음 y) 순서로 처음 count개 픽셀의 최하위 비트를 읽음.
+    필요한 열만 잘라서 읽음
+    """
     width, height = image.size
-    pixels = image.load()
+    columns = min(width, -(-count // height))
+    data = b"".join(image.crop((x, 0, x + 1, height)).tobytes() for x in range(columns))
+    per_pixel = 4 if image.mode == "RGBA" else 3
+    return lsb_from_bytes(data[:count * per_pixel], image.mode == "RGBA")
 
-    has_alpha = True if image.mode == 'RGBA' else False
-    mode = None
-    compressed = False
-    binary_data = ''
-    buffer_a = ''
-    buffer_rgb = ''
-    index_a = 0
-    index_rgb = 0
-    sig_confirmed = False
-    confirming_signature = True
-    reading_param_len = False
-    reading_param = False
-    read_end = False
-    for x in range(width):
-        for y in range(height):
-            if has_alpha:
-                r, g, b, a = pixels[x, y]
-                buffer_a += str(a & 1)
-                index_a += 1
-            else:
-                r, g, b = pixels[x, y]
-            buffer_rgb += str(r & 1)
-            buffer_rgb += str(g & 1)
-            buffer_rgb += str(b & 1)
-            index_rgb += 3
-            if confirming_signature:
-                if index_a == len('stealth_pnginfo') * 8:
-                    decoded_sig = bytearray(int(buffer_a[i:i + 8], 2) for i in
-                                            range(0, len(buffer_a), 8)).decode('utf-8', errors='ignore')
-                    if decoded_sig in {'stealth_pnginfo', 'stealth_pngcomp'}:
-                        confirming_signature = False
-                        sig_confirmed = True
-                        reading_param_len = True
-                        mode = 'alpha'
-                        if decoded_sig == 'stealth_pngcomp':
-                            compressed = True
-                        buffer_a = ''
-                        index_a = 0
-                    else:
-                        read_end = True
-                        break
-                elif index_rgb == len('stealth_pnginfo') * 8:
-                    decoded_sig = bytearray(int(buffer_rgb[i:i + 8], 2) for i in
-                                            range(0, len(buffer_rgb), 8)).decode('utf-8', errors='ignore')
-                    if decoded_sig in {'stealth_rgbinfo', 'stealth_rgbcomp'}:
-                        confirming_signature = False
-                        sig_confirmed = True
-                        reading_param_len = True
-                        mode = 'rgb'
-                        if decoded_sig == 'stealth_rgbcomp':
-                            compressed = True
-                        buffer_rgb = ''
-                        index_rgb = 0
-            elif reading_param_len:
-                if mode == 'alpha':
-                    if index_a == 32:
-                        param_len = int(buffer_a, 2)
-                        reading_param_len = False
-                        reading_param = True
-                        buffer_a = ''
-                        index_a = 0
-                else:
-                    if index_rgb == 33:
-                        pop = buffer_rgb[-1]
-                        buffer_rgb = buffer_rgb[:-1]
-                        param_len = int(buffer_rgb, 2)
-                        reading_param_len = False
-                        reading_param = True
-                        buffer_rgb = pop
-                        index_rgb = 1
-            elif reading_param:
-                if mode == 'alpha':
-                    if index_a == param_len:
-                        binary_data = buffer_a
-                        read_end = True
-                        break
-                else:
-                    if index_rgb >= param_len:
-                        diff = param_len - index_rgb
-                        if diff < 0:
-                            buffer_rgb = buffer_rgb[:diff]
-                        binary_data = buffer_rgb
-                        read_end = True
-                        break
-            else:
-                # impossible
-                read_end = True
-                break
-        if read_end:
-            break
-    if sig_confirmed and binary_data != '':
-        # Convert binary string to UTF-8 encoded text
-        byte_data = bytearray(int(binary_data[i:i + 8], 2)
-                              for i in range(0, len(binary_data), 8))
+
+def read_info_from_lsb(width, height, has_alpha, get_lsb):
+    """
+    stealth pnginfo를 해석합니다. get_lsb(count)는 열 우선 순서로 처음 count개
+    픽셀의 (alpha 비트 문자열, rgb 비트 문자열)을 반환해야 합니다.
+    원본 구현의 픽셀 단위 상태 기계와 같은 결과를 필요한 픽셀만 읽어서 계산합니다.
+    """
+    total = width * height
+    # 서명 확인: rgb는 40픽셀째, alpha는 120픽셀째에 검사
+    if total < SIG_BITS // 3:
+        return None
+    buffer_a, buffer_rgb = get_lsb(min(total, SIG_BITS if has_alpha else SIG_BITS // 3))
+    sig = _bits_to_bytes(buffer_rgb[:SIG_BITS]).decode("utf-8", errors="ignore")
+    if STEALTH_SIGNATURES.get(sig, ("alpha",))[0] != "rgb":
+        if not has_alpha or total < SIG_BITS:
+            return None
+        sig = _bits_to_bytes(buffer_a[:SIG_BITS]).decode("utf-8", errors="ignore")
+        if STEALTH_SIGNATURES.get(sig, ("rgb",))[0] != "alpha":
+            return None
+    mode, compressed = STEALTH_SIGNATURES[sig]
+
+    if mode == "alpha":
+        # 다음 32픽셀이 길이, 그 뒤 param_len 픽셀이 데이터
+        if total < SIG_BITS + 32:
+            return None
+        param_len = int(get_lsb(SIG_BITS + 32)[0][SIG_BITS:], 2)
+        if param_len == 0 or SIG_BITS + 32 + param_len > total:
+            return None
+        binary_data = get_lsb(SIG_BITS + 32 + param_len)[0][SIG_BITS + 32:]
+    else:
+        # 다음 11픽셀(33비트) 중 32비트가 길이, 나머지 비트부터 데이터
+        start = SIG_BITS // 3 + 11
+        if total < start:
+            return None
+        param_len = int(get_lsb(start)[1][SIG_BITS:SIG_BITS + 32], 2)
+        pixels = max(1, -(-(param_len - 1) // 3))
+        if start + pixels > total:
+            return None
+        binary_data = get_lsb(start + pixels)[1][SIG_BITS + 32:SIG_BITS + 32 + param_len]
+
+    if binary_data != '':
+        byte_data = _bits_to_bytes(binary_data)
         try:
             if compressed:
                 decoded_data = gzip.decompress(
@@ -116,6 +102,44 @@ def read_info_from_image_stealth(image):
     return None
 
 
+# from https://github.com/neggles/sd-webui-stealth-pnginfo/
+# 픽셀 단위로 읽던 원본과 결과는 같고, 필요한 열의 픽셀만 한 번에 읽음
+def read_info_from_image_stealth(image):
+    if image.mode not in ("RGB", "RGBA"):
+        # 원본과 같이 픽셀을 (r, g, b[, a])로 풀 수 없는 모드는 예외
+        raise ValueError("Unsupported image mode for stealth pnginfo: %s" % image.mode)
+    image.load()
+    width, height = image.size
+    return read_info_from_lsb(width, height, image.mode == "RGBA",
+                              lambda count: image_lsb(image, count))
+
+
+def write_info_to_image_stealth(image, text, mode="alpha", compressed=False):
+    """stealth pnginfo 형식으로 text를 image 픽셀의 최하위 비트에 기록"""
+    data = text.encode("utf-8")
+    if compressed:
+        data = gzip.compress(data)
+    sig = {value: key for key, value in STEALTH_SIGNATURES.items()}[mode, compressed]
+    bits = "".join(format(b, "08b") for b in sig.encode())
+    bits += format(len(data) * 8, "032b")
+    bits += "".join(format(b, "08b") for b in data)
+
+    width, height = image.size
+    per_pixel = 1 if mode == "alpha" else 3
+    if len(bits) > width * height * per_pixel:
+        raise ValueError("Image is too small for the payload")
+    pixels = image.load()
+    for i in range(0, len(bits), per_pixel):
+        x, y = divmod(i // per_pixel, height)
+        pixel = list(pixels[x, y])
+        if mode == "alpha":
+            pixel[3] = (pixel[3] & ~1) | int(bits[i])
+        else:
+            for c, bit in enumerate(bits[i:i + 3]):
+                pixel[c] = (pixel[c] & ~1) | int(bit)
+        pixels[x, y] = tuple(pixel)
+
+
 if __name__ == "__main__":
     im = Image.open("target.png")
     im.load()
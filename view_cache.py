@@ -0,0 +1,121 @@
+import os
+from collections import OrderedDict
+
+
+def file_stamp(src):
+    """
+    Staleness stamp of a file, a single stat() call.
+    Returns None if the file is gone.
+    """
+    try:
+        st = os.stat(src)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ViewCache:
+    """
+    LRU cache of recently viewed images, bounded by entry count and bytes.
+    Each entry holds the parsed NaiResult and a display-sized pixmap
+    (or any object) together with its approximate byte size.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, stamp):
+        """
+        Return (result, pixmap) if cached and not stale, else None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != stamp:
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1], entry[2]
+
+    def put(self, key, stamp, result, pixmap, nbytes):
+        self.pop(key)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (stamp, result, pixmap, nbytes)
+        self.total_bytes += nbytes
+        while (len(self._entries) > self.max_entries
+               or self.total_bytes > self.max_bytes):
+            _, old = self._entries.popitem(last=False)
+            self.total_bytes -= old[3]
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[3]
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+
+class ViewHistory:
+    """
+    Back/forward navigation over viewed image paths, like a web browser.
+    """
+
+    def __init__(self, max_len=100):
+        self.max_len = max_len
+        self.items = []
+        self.index = -1
+
+    @property
+    def current(self):
+        return self.items[self.index] if self.index >= 0 else None
+
+    def can_back(self):
+        return self.index > 0
+
+    def can_forward(self):
+        return self.index < len(self.items) - 1
+
+    def visit(self, key):
+        if key == self.current:
+            return
+        del self.items[self.index + 1:]
+        self.items.append(key)
+        if len(self.items) > self.max_len:
+            del self.items[0]
+        self.index = len(self.items) - 1
+
+    def back(self):
+        if not self.can_back():
+            return None
+        self.index -= 1
+        return self.current
+
+    def forward(self):
+        if not self.can_forward():
+            return None
+        self.index += 1
+        return self.current
+
+    def remove_current(self, forward=False):
+        """
+        Drop the current item, e.g. when its file can no longer be read,
+        and go back to the item shown before the back()/forward() call.
+        """
+        if self.index < 0:
+            return
+        del self.items[self.index]
+        if forward:
+            self.index -= 1
+        self.index = min(self.index, len(self.items) - 1)